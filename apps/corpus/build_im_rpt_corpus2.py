@@ -21,12 +21,11 @@ stop = datetime(year=2018, month=12, day=31)
 step = timedelta(days=1)
 get_meta = True
 pool_size = 2
-delay = 0.01
 logging_level = logging.DEBUG
 
-# Should make num jobs and delay time dependent
-# -- 16 jobs at night with 0.1 delay
-# -- 2 during day with 1 sec delay
+# Should make num jobs time dependent
+# -- 16 jobs at night
+# -- 2 during day
 
 
 def collect_corpus(_worklist, _pacs, _dest_path):
@@ -37,8 +36,7 @@ def collect_corpus(_worklist, _pacs, _dest_path):
           dest_path=_dest_path,
           inline_reports=False,
           save_as_im=True,
-          anonymize=True,
-          delay=delay)
+          anonymize=True)
 
 
 if __name__ == "__main__":
@@ -9,14 +9,15 @@ from diana.daemons import FileIndexer
 @click.option('-o', '--orthanc_db', default=False,   help="Use subpath width/depth=2", is_flag=True)
 @click.option('-r', '--regex',      default="*.dcm", help="Glob regular expression")
 @click.option('-p', '--pool_size',  default=10,      help="Worker threads")
+@click.option('-t', '--threads',    default=0,       help="File reader threads per worker")
 @click.pass_context
-def findex(ctx, path, registry, orthanc_db, regex, pool_size):
+def findex(ctx, path, registry, orthanc_db, regex, pool_size, threads):
     """Inventory collections of files by accession number with a PATH REGISTRY for retrieval"""
     services = ctx.obj.get('services')
 
     click.echo(click.style('Register Files by Accession Number', underline=True, bold=True))
 
-    file_indexer = FileIndexer(pool_size=pool_size)
+    file_indexer = FileIndexer(pool_size=pool_size, n_threads=threads)
     R = Redis(**services[registry])
 
     result = file_indexer.index_path(
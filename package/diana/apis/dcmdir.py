@@ -1,5 +1,7 @@
 import os, logging, io, hashlib
 from io import BytesIO
+from copy import deepcopy
+from functools import lru_cache
 from pathlib import Path
 from typing import Union, Collection
 import attr
@@ -10,6 +12,15 @@ from ..utils.dicom import DicomLevel, DicomFormatError
 from ..utils.gateways import DcmFileHandler, ZipFileHandler, ImageFileHandler, ImageFileFormat, TextFileHandler
 
 
+@lru_cache(maxsize=40000)
+def read_header_tags(fp: str, stat_key):
+    """Memoized (meta, tags) for a header-only read, 'stat_key' invalidates
+    the entry when the file changes"""
+    ds = DcmFileHandler().get(fp, header_only=True)
+    d = Dixel.from_pydicom(ds, fp)
+    return d.meta, d.tags
+
+
 @attr.s
 class DcmDir(Endpoint, Serializable):
 
@@ -18,8 +29,15 @@ class DcmDir(Endpoint, Serializable):
     subpath_width = attr.ib(default=2)
     subpath_depth = attr.ib(default=0)
 
-    gateway = attr.ib(init=False, repr=False)
-    @gateway.default
+    # Created on first use, so unused or pickled dirs stay cheap
+    _gateway = attr.ib(init=False, repr=False, default=None)
+
+    @property
+    def gateway(self):
+        if self._gateway is None:
+            self._gateway = self.setup_gateway()
+        return self._gateway
+
     def setup_gateway(self):
         return DcmFileHandler(path=self.path,
                               subpath_width = self.subpath_width,
@@ -28,6 +46,7 @@ class DcmDir(Endpoint, Serializable):
     anonymizing = attr.ib(default=False)
     recurse_style = attr.ib(default="UNSTRUCTURED")
     _gen = attr.ib(init=False, repr=False, default=None)
+    _logger = attr.ib(init=False, repr=False, default=None)
 
     def put(self, item: Dixel, **kwargs):
         self.logger.debug("EP PUT")
@@ -62,9 +81,25 @@ class DcmDir(Endpoint, Serializable):
         else:
             file = None
 
-        if DixelView.TAGS in view or DixelView.PIXELS in view:
+        header_only = kwargs.get("header_only", False)
+
+        if header_only and DixelView.TAGS in view and not get_pixels and not file:
+            # Re-reading unchanged headers is a cache hit
+            fp = self.gateway.get_path(fn)
+            st = os.stat(fp)
             try:
-                ds = self.gateway.get(fn, get_pixels=get_pixels)
+                meta, tags = read_header_tags(fp, (st.st_mtime_ns, st.st_size))
+            except (pydicom.errors.InvalidDicomError, DicomFormatError) as e:
+                self.logger.warning(f"Failed to parse with {e}")
+                return
+            result = Dixel(meta={**meta, "FileName": fn},
+                           tags=deepcopy(tags),
+                           level=DicomLevel.INSTANCES)
+
+        elif DixelView.TAGS in view or DixelView.PIXELS in view:
+            try:
+                ds = self.gateway.get(fn, get_pixels=get_pixels,
+                                      header_only=header_only)
                 # logging.debug(ds)
                 result = Dixel.from_pydicom(ds, fn, file=file)
             except (pydicom.errors.InvalidDicomError, DicomFormatError) as e:
@@ -162,25 +197,58 @@ class DcmDir(Endpoint, Serializable):
                 return orthanc_dir
 
     class unstructured_subdirs(object):
-        """Generates subdirs with os.walk, this remains _very_ slow for large datasets!"""
+        """Generates subdirs with os.scandir, this remains _very_ slow for large datasets!"""
 
         def __init__(self, base_dir):
             self.base_dir = base_dir
-            self.generator = os.walk(base_dir)
+            self.generator = self.walk(base_dir)
+
+        @staticmethod
+        def walk(top):
+            # Top-down, so each dir is yielded as soon as it is found.
+            # DirEntry.is_dir() uses the cached d_type, so there is no stat per
+            # entry; symlinks and hidden (scratch) dirs are not followed.
+            stack = [os.fspath(top)]
+            while stack:
+                path = stack.pop()
+                yield path
+                try:
+                    with os.scandir(path) as entries:
+                        for entry in entries:
+                            if entry.is_dir(follow_symlinks=False) and \
+                                    not entry.name.startswith("."):
+                                stack.append(entry.path)
+                except OSError:
+                    # Unreadable, skip it like os.walk does
+                    continue
 
         def __iter__(self):
             return self
 
         def __next__(self):
-            item = self.generator.__next__()
-            return item[0]
+            return self.generator.__next__()
 
     def files(self, rex="*.dcm"):
         return self.gateway.get_files(rex=rex)
 
+    def inventory(self) -> set:
+        """Snapshot of file names under path, so bulk exists checks can
+        test membership instead of hitting the file system for each item"""
+        result = set()
+        for path in DcmDir.unstructured_subdirs(self.path):
+            result.update(DcmDir(path=path).files(rex="*"))
+        return result
+
+    def inventory_key(self, item: Dixel) -> str:
+        """Key for item in inventory()"""
+        return item.fn
+
     @property
     def logger(self):
-        return logging.getLogger(self.name)
+        # Cached, get() and exists() are called once per file when indexing
+        if not self._logger:
+            self._logger = logging.getLogger(self.name)
+        return self._logger
 
 
 
@@ -188,8 +256,6 @@ class DcmDir(Endpoint, Serializable):
 class ReportDir(DcmDir):
     name = attr.ib(default="ReportDir")
 
-    gateway = attr.ib(init=False, repr=False)
-    @gateway.default
     def setup_gateway(self):
         return TextFileHandler(path=self.path,
                                 subpath_width = self.subpath_width,
@@ -206,8 +272,7 @@ class ReportDir(DcmDir):
         return self.gateway.exists(fn)
 
     def put(self, item: Dixel, **kwargs):
-        logger = logging.getLogger(self.name)
-        logger.debug("EP PUT")
+        self.logger.debug("EP PUT")
 
         if self.anonymizing:
             base_fn = hashlib.md5(item.tags["AccessionNumber"].encode("UTF-8")).hexdigest()
@@ -226,32 +291,34 @@ class ImageDir(DcmDir):
     name = attr.ib(default="ImageDir")
     format = attr.ib(default=ImageFileFormat.PNG)
 
-    gateway = attr.ib(init=False, repr=False)
-    @gateway.default
     def setup_gateway(self):
         return ImageFileHandler(path=self.path,
                                 subpath_width = self.subpath_width,
                                 subpath_depth = self.subpath_depth)
 
-    def exists(self, item: Union[Dixel, str]):
-        """Uses regular expression exists in gateway"""
-        logger = logging.getLogger(self.name)
-        logger.debug("EP EXISTS")
-
+    def base_fn(self, item: Union[Dixel, str]) -> str:
         if isinstance(item, Dixel):
             item = item.tags["AccessionNumber"]
 
         if self.anonymizing:
-            base_fn = hashlib.md5(item.encode("UTF-8")).hexdigest()
-        else:
-            base_fn = item
+            return hashlib.md5(item.encode("UTF-8")).hexdigest()
+        return item
 
-        fnre="{}*".format(base_fn)
+    def exists(self, item: Union[Dixel, str]):
+        """Uses regular expression exists in gateway"""
+        self.logger.debug("EP EXISTS")
+        fnre="{}*".format(self.base_fn(item))
         return self.gateway.exists_re(fnre)
 
+    def inventory(self) -> set:
+        # Image files are named "{base_fn}-{series}-{instance}.{ext}"
+        return {fn.rsplit("-", 2)[0] for fn in super().inventory()}
+
+    def inventory_key(self, item: Union[Dixel, str]) -> str:
+        return self.base_fn(item)
+
     def put(self, item: Dixel, **kwargs):
-        logger = logging.getLogger(self.name)
-        logger.debug("EP PUT")
+        self.logger.debug("EP PUT")
 
         if item.level != DicomLevel.INSTANCES:
             self.put_zipped(item.file)
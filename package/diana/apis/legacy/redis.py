@@ -128,10 +128,15 @@ class Redis(Endpoint, Serializable):
 
     ### Collections
 
+    def pipeline(self):
+        """Non-transactional command buffer, pass as 'pipe' and call execute() to flush"""
+        return self.gateway.pipeline(transaction=False)
+
     def add_to_collection(self, item: Dixel, prefix: str="",
                                  collection_key: str = "AccessionNumber",
                                  item_key: str = "FilePath",
-                                 path=None ):
+                                 path=None,
+                                 pipe=None ):
         """
         It is non-obvious how to check the total number of objects across all sets.
         This works and its fast for even large data sets.
@@ -139,6 +144,9 @@ class Redis(Endpoint, Serializable):
         > EVAL "local total = 0 for _, key in ipairs(redis.call('keys', ARGV[1])) do total = total + redis.call('scard', key) end return total" 0 prefix-*
 
         See <https://stackoverflow.com/questions/34563144/redis-multiple-key-set-counts>
+
+        Pass a 'pipe' from pipeline() to queue the registration rather than
+        making a round-trip for each item.
         """
 
         if item_key == "FilePath" and path:
@@ -162,7 +170,10 @@ class Redis(Endpoint, Serializable):
         logger = logging.getLogger(self.name)
         logger.info("Registering {} under {}".format(value, key))
 
-        self.gateway.sadd(key, value)
+        if pipe is not None:
+            pipe.sadd(key, value)
+        else:
+            self.gateway.sadd(key, value)
 
     def collections(self, prefix: str=""):
         keys = self.gateway.keys(prefix+"*")
@@ -1,4 +1,6 @@
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import click
 from crud.cli.utils import ClickEndpoint
 from diana.apis import DcmDir
@@ -12,21 +14,40 @@ def dgetall(ctx, source: DcmDir, binary):
     """Get all instances from DcmDir for chaining"""
     click.echo(click.style('Get All Items from DcmDir', underline=True, bold=True))
 
-    items = []
-    for root, dirs, files in os.walk(source.path):
-        for file in files:
-            items.append(os.path.join(root, file))
+    def fns():
+        for root, dirs, files in os.walk(source.path, topdown=True, followlinks=False):
+            # Skip hidden scratch dirs
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for fn in files:
+                # DcmDir re-roots file names on its own path
+                yield os.path.relpath(os.path.join(root, fn), source.path)
+
+    def get(fn):
+        return source.get(fn, file=binary)
+
+    def gets(executor, window):
+        # Only a window of reads is in flight, so the walk advances as
+        # results are taken rather than queueing the whole tree up front
+        pending = deque()
+        for fn in fns():
+            pending.append(executor.submit(get, fn))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
 
     nitems = 0
-    for item in items:
-        _item = source.get(item, file=binary)
-        if _item:
-            ctx.obj["items"].append(_item)
-            nitems+=1
+    max_workers = 32
+    # Reads are i/o-bound, so threads overlap them despite the GIL
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for _item in gets(executor, 2 * max_workers):
+            if _item:
+                ctx.obj["items"].append(_item)
+                nitems+=1
 
     ctx.obj["source"] = source
 
     click.echo("Found {} item{}".format(
         nitems,
         "" if nitems == 1 else "s"
-    ))
\ No newline at end of file
+    ))
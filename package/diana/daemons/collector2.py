@@ -1,22 +1,95 @@
-from multiprocessing import Pool, Value, Process, Queue, Manager
+from multiprocessing import Pool, Value, Process, Queue, Manager, Event, TimeoutError
 from multiprocessing.managers import BaseProxy
-import itertools, logging, hashlib
-from time import sleep
+import logging, hashlib, threading
 from functools import partial
+from queue import Full
 from datetime import datetime, timedelta
+from enum import Enum
 from typing import Union, Iterable
 from pathlib import Path
 import attr
 
 from ..apis import ProxiedDicom, DcmDir, ImageDir, CsvFile, ReportDir
 from ..dixel import Dixel, DixelView
-from ..utils.endpoint import Serializable
+from crud.abc import Serializable
 from ..utils.gateways import CSVPMap, CSVArrayPMap
 
+# Minimal data for oid and sham plus study desc
+QUERY_TEMPLATE = {
+    "PatientName": "",
+    "PatientID": "",
+    "PatientBirthDate": "",
+    "PatientSex": "",
+    "AccessionNumber": "",
+    "StudyDescription": "",
+    "StudyInstanceUID": "",
+    "StudyDate": "",
+    "StudyTime": ""
+}
+
+# Only the parent process writes the counters, so workers never contend
+# for their locks; the progress thread just reads them
 handled = Value('i', 0)
 skipped = Value('i', 0)
 failed = Value('i', 0)
 
+
+class HandlerStatus(Enum):
+    FAILED = "failed"
+    SKIPPED = "skipped"
+    HANDLED = "handled"
+
+
+class _Skip(Exception):
+    """Raised by the item handler to exit early without collecting"""
+
+
+class _Fail(Exception):
+    """Raised by the item handler when an item cannot be collected"""
+
+
+def count(status: HandlerStatus):
+    counter = {HandlerStatus.HANDLED: handled,
+               HandlerStatus.SKIPPED: skipped,
+               HandlerStatus.FAILED: failed}[status]
+    counter.value += 1
+
+
+# Per-process item handler and run abort flag for pooled workers
+worker_handler = None
+worker_abort = None
+
+
+def init_worker(source_desc: dict, existing: set = None, handler_kwargs: dict = None,
+                abort: Event = None):
+    """Pool initializer, creates a fresh source once for each worker process
+    and binds it and the inventory into the worker's item handler"""
+    global worker_handler, worker_abort
+    source = Serializable.Factory.create(**source_desc)
+    worker_handler = partial(Collector.handle_item,
+                             source=source,
+                             existing=existing,
+                             **(handler_kwargs or {}))
+    worker_abort = abort
+
+
+def handle_worker_item(item: Dixel) -> HandlerStatus:
+    # Once a run has failed, queued items are passed over
+    if worker_abort is not None and worker_abort.is_set():
+        return None
+    return worker_handler(item)
+
+
+def report_progress(stop: threading.Event, interval: float = 5.0):
+    """Log the shared counters every interval until stopped"""
+    logger = logging.getLogger("Collector")
+    while not stop.wait(interval):
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Handled {} items, skipped {}, failed {}".format(handled.value,
+                                                                        skipped.value,
+                                                                        failed.value))
+
+
 # TODO: Don't write key if no change
 # TODO: Don't write report if no change
 # DONE: Don't pull images if images already exist
@@ -28,12 +101,6 @@ failed = Value('i', 0)
 class Collector(object):
 
     pool_size = attr.ib( default=0 )
-    pool = attr.ib( init=False, repr=False )
-
-    @pool.default
-    def create_pool(self):
-        if self.pool_size > 0:
-            return Pool(self.pool_size)
 
     sublist_len = attr.ib( init=False )
     @sublist_len.default
@@ -52,67 +119,120 @@ class Collector(object):
             dest_path: Path,
             inline_reports: bool = True,
             anonymize: bool = True,
-            save_as_im: bool = False,
-            delay: float = 0.01):
+            save_as_im: bool = False):
 
         tic = datetime.now()
+        handled.value = 0
+        skipped.value = 0
+        failed.value = 0
 
-        if save_as_im:
-            data_dest = ImageDir(path=dest_path / "images",
-                                 subpath_width=2,
-                                 subpath_depth=2,
-                                 anonymizing=anonymize)
-        else:
-            data_dest = DcmDir(path=dest_path / "images",
-                               subpath_width=2,
-                               subpath_depth=2)
-
-        if not inline_reports:
-            report_dest = ReportDir(path=dest_path / "reports",
-                                    subpath_width=2,
-                                    subpath_depth=2,
-                                    anonymizing=anonymize)
-        else:
-            report_dest = None
-
-        pattern = "{}/meta/key-{{}}.csv".format(dest_path)
-        fieldnames = ["id", "modality", "body_parts", "cpts",
-                      "age", "sex", "status", "radcat"]
-        key_handler = CSVArrayPMap(fn=pattern, keyfield="id", fieldnames=fieldnames)
-
-        if self.pool_size == 0:
-            for item in worklist:
-                Collector.handle_item(item=item,
-                                 source=source,
-                                 data_dest=data_dest,
-                                 report_dest=report_dest,
-                                 anonymize=anonymize,
-                                 key_handler=key_handler)
-        else:
-            m = Manager()
-            q = m.Queue()
-            kh = Process(target=key_handler.run, args=[q], kwargs={"early_exit": True})
-            kh.start()
-
-            p = partial(Collector.handle_item,
-                         source=source,
-                         data_dest=data_dest,
-                         report_dest=report_dest,
-                         anonymize=anonymize,
-                         key_handler=q)
-
-            while True:
-                result = self.pool.map(p, itertools.islice(worklist, self.sublist_len))
-                if result:
-                    sleep(delay)
-                else:
-                    break
-
-            # Finish keying if necessary
-            print("Waiting for keying to be finished")
-            while not q.empty():
-                sleep(0.1)
-            kh.terminate()
+        stop_progress = threading.Event()
+        threading.Thread(target=report_progress, args=[stop_progress], daemon=True).start()
+
+        try:
+            if save_as_im:
+                data_dest = ImageDir(path=dest_path / "images",
+                                     subpath_width=2,
+                                     subpath_depth=2,
+                                     anonymizing=anonymize)
+            else:
+                data_dest = DcmDir(path=dest_path / "images",
+                                   subpath_width=2,
+                                   subpath_depth=2)
+
+            # One walk up front rather than an exists() call on the fs for every item
+            existing = data_dest.inventory()
+            print("Found {} existing items".format(len(existing)))
+
+            if not inline_reports:
+                report_dest = ReportDir(path=dest_path / "reports",
+                                        subpath_width=2,
+                                        subpath_depth=2,
+                                        anonymizing=anonymize)
+            else:
+                report_dest = None
+
+            pattern = "{}/meta/key-{{}}.csv".format(dest_path)
+            fieldnames = ["id", "modality", "body_parts", "cpts",
+                          "age", "sex", "status", "radcat"]
+            key_handler = CSVArrayPMap(fn=pattern, keyfield="id", fieldnames=fieldnames)
+
+            if self.pool_size == 0:
+                for item in worklist:
+                    result = Collector.handle_item(item=item,
+                                                   source=source,
+                                                   data_dest=data_dest,
+                                                   report_dest=report_dest,
+                                                   anonymize=anonymize,
+                                                   key_handler=key_handler,
+                                                   existing=existing)
+                    count(result)
+            else:
+                with Manager() as m:
+                    # Bounded so that keying applies backpressure to the workers
+                    q = m.Queue(maxsize=2 * self.pool_size)
+                    kh = Process(target=key_handler.run, args=[q], kwargs={"early_exit": True})
+                    kh.start()
+
+                    try:
+                        # Pooled jobs reuse their worker's source and its open session
+                        handler_kwargs = {"data_dest": data_dest,
+                                          "report_dest": report_dest,
+                                          "anonymize": anonymize,
+                                          "key_handler": q}
+
+                        abort = Event()
+
+                        def feed():
+                            for item in worklist:
+                                if abort.is_set():
+                                    return
+                                yield item
+
+                        error = None
+                        with Pool(self.pool_size,
+                                  initializer=init_worker,
+                                  initargs=(source.asdict(), existing, handler_kwargs, abort)) as pool:
+                            # Stream items so that fast workers never wait on slow ones
+                            chunksize = max(1, self.sublist_len // 4)
+                            results = pool.imap_unordered(handle_worker_item, feed(),
+                                                          chunksize=chunksize)
+                            while True:
+                                try:
+                                    result = results.next(timeout=1.0)
+                                except StopIteration:
+                                    break
+                                except TimeoutError:
+                                    # Workers block on the bounded queue if keying has died
+                                    if not kh.is_alive():
+                                        raise RuntimeError("Key handler exited with code {}".format(kh.exitcode))
+                                    continue
+                                except Exception as e:
+                                    # Drain the pool before raising, terminating workers
+                                    # that are still returning results can deadlock it
+                                    error = error or e
+                                    abort.set()
+                                    continue
+                                if result is not None:
+                                    count(result)
+                        if error is not None:
+                            raise error
+                    finally:
+                        # Let keying finish what was queued, but never wait
+                        # on a handler that has died
+                        print("Waiting for keying to be finished")
+                        while kh.is_alive():
+                            try:
+                                q.put(None, timeout=1.0)
+                                break
+                            except Full:
+                                pass
+                        kh.join()
+
+                if kh.exitcode != 0:
+                    raise RuntimeError("Key handler exited with code {}".format(kh.exitcode))
+        finally:
+            stop_progress.set()
 
         toc = datetime.now()
         elapsed_time = (toc - tic).seconds or 1
@@ -130,7 +250,33 @@ class Collector(object):
                     data_dest: Union[DcmDir, ImageDir],
                     report_dest: ReportDir = None,
                     anonymize: bool = True,
-                    key_handler=None):
+                    key_handler=None,
+                    existing: set = None) -> HandlerStatus:
+        """Collect a single item and report how it went"""
+        try:
+            Collector._handle_item(item,
+                                   source=source,
+                                   data_dest=data_dest,
+                                   report_dest=report_dest,
+                                   anonymize=anonymize,
+                                   key_handler=key_handler,
+                                   existing=existing)
+        except _Skip as e:
+            logging.info(e)
+            return HandlerStatus.SKIPPED
+        except _Fail as e:
+            logging.error(e)
+            return HandlerStatus.FAILED
+        return HandlerStatus.HANDLED
+
+    @staticmethod
+    def _handle_item(item: Dixel,
+                     source: ProxiedDicom,
+                     data_dest: Union[DcmDir, ImageDir],
+                     report_dest: ReportDir = None,
+                     anonymize: bool = True,
+                     key_handler=None,
+                     existing: set = None):
 
         ####################
         # KEYING
@@ -177,49 +323,25 @@ class Collector(object):
         # IMAGES
         ####################
 
-        if data_dest.exists(item):
-            logging.info("Item {} already exists as images, exiting early".format(item.acc_num))
-            skipped.value += 1
-            print("Handled {} items, skipped {}, failed {}".format(handled.value,
-                                                                   skipped.value,
-                                                                   failed.value))
-            return
-
-        # Minimal data for oid and sham plus study desc
-        def mkq(item):
-            return {
-                "PatientName": "",
-                "PatientID": "",
-                "PatientBirthDate": "",
-                "PatientSex": "",
-                "AccessionNumber": item.acc_num,
-                "StudyDescription": "",
-                "StudyInstanceUID": "",
-                "StudyDate": "",
-                "StudyTime": ""
-            }
-
-        # Get a fresh source, in case this is a pooled job
-        source = Serializable.Factory.copy(source)
-
-        r = source.find(mkq(item), retrieve=True)
+        if existing is not None:
+            key = data_dest.inventory_key(item)
+            item_exists = key in existing
+        else:
+            item_exists = data_dest.exists(item)
+
+        if item_exists:
+            raise _Skip("Item {} already exists as images, exiting early".format(item.acc_num))
+
+        q = dict(QUERY_TEMPLATE)
+        q["AccessionNumber"] = item.acc_num
+        r = source.find(q, retrieve=True)
         if not r:
-            logging.error("Item {} not findable!".format(item.acc_num))
-            failed.value += 1
-            print("Handled {} items, skipped {}, failed {}".format(handled.value,
-                                                                   skipped.value,
-                                                                   failed.value))
-            return
+            raise _Fail("Item {} not findable!".format(item.acc_num))
         item.tags.update(r[0])
 
         # TODO: Log failures so we can retry them
         if not source.proxy.exists(item):
-            logging.error("Item {} not retrieved!".format(item.acc_num))
-            failed.value += 1
-            print("Handled {} items, skipped {}, failed {}".format(handled.value,
-                                                                   skipped.value,
-                                                                   failed.value))
-            return
+            raise _Fail("Item {} not retrieved!".format(item.acc_num))
 
         if anonymize and not isinstance(data_dest, ImageDir):
             # No need to anonymize if we are converting to images
@@ -227,18 +349,10 @@ class Collector(object):
 
         try:
             item = source.proxy.get(item, view=DixelView.FILE)
-        except FileNotFoundError as e:
-            logging.error("Item {} not findable!".format(item.acc_num))
-            failed.value += 1
-            print("Handled {} items, skipped {}, failed {}".format(handled.value,
-                                                                   skipped.value,
-                                                                   failed.value))
-            return
+        except FileNotFoundError:
+            raise _Fail("Item {} not findable!".format(item.acc_num))
 
         data_dest.put(item)
         source.proxy.delete(item)
-
-        handled.value += 1
-        print("Handled {} items, skipped {}, failed {}".format(handled.value,
-                                                               skipped.value,
-                                                               failed.value))
+        if existing is not None:
+            existing.add(key)
@@ -1,7 +1,10 @@
-import logging, hashlib
+import logging, zlib, threading
 from datetime import datetime
 from multiprocessing import Pool, Value
-from functools import partial
+from queue import Queue, Full, Empty
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, lru_cache
+from typing import Iterable
 import attr
 from ..apis import Redis, DcmDir, Orthanc
 from ..dixel import DixelView
@@ -12,20 +15,26 @@ registered = Value('i', 0)
 uploaded = Value('i', 0)
 
 
-def index_file(fn, path=None, reg=None, prefix=None,
+def index_file(fn, path=None, reg=None, prefix=None, pipe=None,
                _checked: Value = checked,
                _registered: Value = registered):
 
-    _checked.value += 1
-    if _checked.value % 1000 == 0:
-        print("Indexing - {} checked".format(_checked.value))
+    with _checked.get_lock():
+        _checked.value += 1
+        if _checked.value % 1000 == 0:
+            print("Indexing - {} checked".format(_checked.value))
     if not isinstance(reg, Redis):
         reg = Redis(**reg)
     try:
-        d = DcmDir(path=path).get(fn, view=DixelView.TAGS)
-        reg.add_to_collection(d, path=path, prefix=prefix)
+        d = DcmDir(path=path).get(fn, view=DixelView.TAGS, header_only=True)
+        if d is None:
+            # DcmDir.get already logged the parse failure
+            logging.debug("Skipping non-DICOM or poorly formatted file {}".format(fn))
+            return
+        reg.add_to_collection(d, path=path, prefix=prefix, pipe=pipe)
         logging.info("Registered DICOM file {}".format(fn))
-        _registered.value += 1
+        with _registered.get_lock():
+            _registered.value += 1
     except (ValueError, DicomFormatError):
         logging.debug("Skipping non-DICOM or poorly formatted file {}".format(fn))
         pass
@@ -34,6 +43,63 @@ def index_file(fn, path=None, reg=None, prefix=None,
         pass
 
 
+def index_files(tasks: Iterable, reg=None, prefix=None, batch_size=512):
+    """Index (fn, path) tasks, queueing registrations on a single pipeline.
+    Pipelines are not thread-safe, so each reader thread calls this itself."""
+    if not isinstance(reg, Redis):
+        reg = Redis(**reg)
+    pipe = reg.pipeline()
+    try:
+        for i, (fn, path) in enumerate(tasks, 1):
+            try:
+                index_file(fn, path=path, reg=reg, prefix=prefix, pipe=pipe)
+            except Exception as e:
+                logging.error("Failed to index {} with {}".format(fn, e))
+            if i % batch_size == 0:
+                pipe.execute()
+    finally:
+        pipe.execute()
+
+
+# Per-process registry client and reader threads for pooled indexing
+worker_registry = None
+worker_readers = None
+worker_threads = 0
+
+
+def init_worker(reg_desc: dict, n_threads: int = 0):
+    """Pool initializer, connects each worker process to the registry and
+    starts its reader threads once"""
+    global worker_registry, worker_readers, worker_threads
+    worker_registry = Redis(**reg_desc)
+    worker_threads = n_threads
+    if n_threads > 0:
+        worker_readers = ThreadPoolExecutor(max_workers=n_threads)
+
+
+def index_chunk(tasks: list, prefix=None, batch_size=512):
+    """Index a chunk of (fn, path) tasks with the worker's registry, dealing
+    it out to the worker's reader threads if it has any"""
+    if worker_readers is None:
+        index_files(tasks,
+                    reg=worker_registry,
+                    prefix=prefix,
+                    batch_size=batch_size)
+        return
+
+    # Each reader queues on its own pipeline; only file names are pickled
+    # to the worker, never datasets
+    shards = [tasks[i::worker_threads] for i in range(worker_threads)]
+    readers = [worker_readers.submit(index_files,
+                                     shard,
+                                     reg=worker_registry,
+                                     prefix=prefix,
+                                     batch_size=batch_size)
+               for shard in shards if shard]
+    for r in readers:
+        r.result()
+
+
 def put_inst(fn, dest, _uploaded: Value = uploaded):
 
     d = DcmDir().get(fn, view=DixelView.FILE)  # Don't need pydicom data
@@ -50,15 +116,25 @@ class FileIndexer(object):
     """Create a registry for all files in a DICOM directory and subdirs"""
 
     pool_size = attr.ib( default=0 )
-    pool = attr.ib( init=False, repr=False )
-    @pool.default
-    def create_pool(self):
-        if self.pool_size > 0:
-            return Pool(self.pool_size)
+    # Upload pool, created on first use; indexing runs its own initialized pool
+    _pool = attr.ib( init=False, repr=False, default=None )
+
+    @property
+    def pool(self):
+        if self._pool is None and self.pool_size > 0:
+            self._pool = Pool(self.pool_size)
+        return self._pool
+
+    # File reads are blocked on i/o, so threads scale well past the core count
+    n_threads = attr.ib( default=0 )
+    # Registrations queued per Redis round-trip
+    batch_size = attr.ib( default=512 )
 
     @staticmethod
+    @lru_cache(maxsize=None)
     def prefix_for_path(basepath):
-        reg_prefix = hashlib.md5(basepath.encode("UTF-*")).hexdigest()[0:4] + "-"
+        # Opaque 16-bit registry bucket, a non-cryptographic checksum is plenty
+        reg_prefix = "{:04x}-".format(zlib.crc32(basepath.encode("utf-8")) & 0xFFFF)
         return reg_prefix
 
     @staticmethod
@@ -81,22 +157,16 @@ class FileIndexer(object):
 
         reg_prefix = FileIndexer.prefix_for_path(basepath)
         D = DcmDir(path=basepath, recurse_style=recurse_style)
-        for path in D.subdirs():
-            print("Working on path: {}".format(path))
-            files = DcmDir(path=path).files(rex=rex)
-
-            if self.pool_size == 0:
-                for fn in files:
-                    index_file(fn,
-                               path=path,
-                               reg=registry,
-                               prefix=reg_prefix)
-            else:
-                p = partial(index_file,
-                            path=path,
-                            reg=registry.asdict(),
-                            prefix=reg_prefix )
-                self.pool.map(p, files)
+
+        if self.pool_size > 0:
+            self.index_pooled(D, registry, rex, reg_prefix)
+        elif self.n_threads > 0:
+            self.index_threaded(D, registry, rex, reg_prefix)
+        else:
+            index_files(self.walk_files(D, rex),
+                        reg=registry,
+                        prefix=reg_prefix,
+                        batch_size=self.batch_size)
 
         toc = datetime.now()
         elapsed_time = (toc-tic).seconds or 1
@@ -107,6 +177,88 @@ class FileIndexer(object):
         print("Checking rate: {} files per second".format(round(checking_rate,1)))
         print("Handling rate: {} files per second".format(round(handling_rate,1)))
 
+    @staticmethod
+    def walk_files(D: DcmDir, rex):
+        """Yield (fn, path) for each matching file in D's subdirs"""
+        for path in D.subdirs():
+            print("Working on path: {}".format(path))
+            for fn in DcmDir(path=path).files(rex=rex):
+                yield fn, path
+
+    def index_pooled(self, D: DcmDir, registry, rex, reg_prefix):
+        """Stream chunks of files from all subdirs to the process pool"""
+
+        def chunks():
+            chunk = []
+            for task in self.walk_files(D, rex):
+                chunk.append(task)
+                # One pipeline round-trip per chunk
+                if len(chunk) == self.batch_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+        # Workers index with the registry client and threads from init_worker
+        p = partial(index_chunk,
+                    prefix=reg_prefix,
+                    batch_size=self.batch_size)
+
+        with Pool(self.pool_size,
+                  initializer=init_worker,
+                  initargs=(registry.asdict(), self.n_threads)) as pool:
+            for _ in pool.imap_unordered(p, chunks()):
+                pass
+
+    def index_threaded(self, D: DcmDir, registry, rex, reg_prefix):
+        """Walk subdirs in one thread and feed their files to a pool of reader threads"""
+
+        work = Queue(maxsize=4 * self.n_threads)
+        failed = threading.Event()
+
+        def put(task):
+            while True:
+                try:
+                    work.put(task, timeout=1.0)
+                    return
+                except Full:
+                    if failed.is_set():
+                        # Readers may all be gone, drop their backlog
+                        try:
+                            while True:
+                                work.get_nowait()
+                        except Empty:
+                            pass
+
+        def walk():
+            try:
+                for task in self.walk_files(D, rex):
+                    if failed.is_set():
+                        return
+                    put(task)
+            finally:
+                # One stop sentinel per reader
+                for i in range(self.n_threads):
+                    put(None)
+
+        def read():
+            try:
+                # Stops at this reader's sentinel
+                index_files(iter(work.get, None),
+                            reg=registry,
+                            prefix=reg_prefix,
+                            batch_size=self.batch_size)
+            except Exception:
+                failed.set()
+                raise
+
+        with ThreadPoolExecutor(max_workers=self.n_threads + 1) as executor:
+            walker = executor.submit(walk)
+            readers = [executor.submit(read) for i in range(self.n_threads)]
+        walker.result()
+        for r in readers:
+            r.result()
+
     def upload_path(self, basepath, registry: Redis, dest: Orthanc):
 
         tic = datetime.now()
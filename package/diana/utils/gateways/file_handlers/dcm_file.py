@@ -4,9 +4,80 @@ import logging, binascii
 from pathlib import Path
 import attr
 import pydicom
+import pydicom.config
+try:
+    from pydicom.pixels import get_decoder
+except ImportError:
+    # pydicom < 3 only decodes through the ordered pixel_data_handlers
+    get_decoder = None
 from .file_handler import FileHandler
 from ...dicom import DicomFormatError
 
+# Large enough to take most headers in a single read(2), small enough not to
+# drag in pixel data that a header-only read will never look at
+READ_BUFFER_SIZE = 64 * 1024
+
+# Closed set of tags needed to identify, date, and register an instance
+HEADER_TAGS = [
+    "PatientName", "PatientID",
+    "AccessionNumber",
+    "StudyInstanceUID", "SeriesInstanceUID", "SOPInstanceUID",
+    "StudyDate", "StudyTime",
+    "SeriesDate", "SeriesTime",
+    "InstanceCreationDate", "InstanceCreationTime",
+    "StationName", "DeviceSerialNumber"
+]
+
+
+# Compiled decoders to try first for compressed pixel data
+PREFERRED_DECODERS = ["pylibjpeg", "gdcm"]
+
+
+def prefer_compiled_pixel_handlers():
+    """Try the compiled pylibjpeg and gdcm handlers first for compressed pixel
+    data with pydicom < 3 (or its v2 backend).  pydicom skips any handler that
+    isn't installed.  This reorders pydicom's global handler list, so it is
+    left to applications to call once at startup."""
+    order = ["pylibjpeg_handler", "gdcm_handler"]
+
+    def rank(handler):
+        name = handler.__name__.rsplit(".", 1)[-1]
+        return order.index(name) if name in order else len(order)
+
+    pydicom.config.pixel_data_handlers.sort(key=rank)
+
+
+def preferred_decoding_plugin(ds: pydicom.Dataset) -> str:
+    """Name of the first preferred decoder installed for the dataset's transfer
+    syntax, or "" to leave the choice to pydicom"""
+    if get_decoder is None:
+        return ""
+    try:
+        decoder = get_decoder(ds.file_meta.TransferSyntaxUID)
+    except (AttributeError, NotImplementedError):
+        return ""
+    for name in PREFERRED_DECODERS:
+        if name in decoder.available_plugins:
+            return name
+    return ""
+
+
+def use_preferred_decoder(ds: pydicom.Dataset):
+    """Decode pixels with the preferred plugin, or leave the choice of plugin
+    to pydicom again if that one fails"""
+    plugin = preferred_decoding_plugin(ds)
+    if not plugin:
+        return
+    ds.pixel_array_options(decoding_plugin=plugin)
+    try:
+        # Decode now so a failure can fall back, the array is cached on ds
+        ds.pixel_array
+    except (RuntimeError, ValueError) as e:
+        logger = logging.getLogger("DcmFileHandler")
+        logger.debug("Failed to decode with {}, falling back ({})".format(plugin, e))
+        ds.pixel_array_options()
+
+
 @attr.s
 class DcmFileHandler(FileHandler):
 
@@ -35,15 +106,31 @@ class DcmFileHandler(FileHandler):
             logger.debug("Checking data is dicom")
             return check(item)
 
-    def get(self, fn: str, get_pixels=False, force=False) -> pydicom.Dataset:
+    def get(self, fn: str, get_pixels=False, force=False, header_only=False) -> pydicom.Dataset:
         fp = self.get_path(fn)
         logger = logging.getLogger(self.name)
 
-        if not self.is_dicom(fp):
-            raise DicomFormatError("Not a DCM file: {}".format(fp))
+        if header_only and not get_pixels:
+            # Skip parsing everything but the identifying tags
+            specific_tags = HEADER_TAGS
+        else:
+            specific_tags = None
+
+        # Open once for both the magic check and the parse
+        with open(fp, 'rb', buffering=READ_BUFFER_SIZE) as f:
+            if not self.is_dicom(f):
+                raise DicomFormatError("Not a DCM file: {}".format(fp))
+            f.seek(0)
+
+            logger.debug("Reading {}".format(fp))
+            ds = pydicom.dcmread(f,
+                                 stop_before_pixels=not get_pixels,
+                                 force=force,
+                                 specific_tags=specific_tags)
 
-        logger.debug("Reading {}".format(fp))
-        ds = pydicom.dcmread(fp, stop_before_pixels=not get_pixels, force=force)
+        if get_pixels and get_decoder is not None and "PixelData" in ds:
+            # pydicom 3 ignores pixel_data_handlers and picks its own plugin
+            use_preferred_decoder(ds)
         return ds
 
     def put(self, fn: str, data):
@@ -1,6 +1,7 @@
 import logging, os
 from pathlib import Path
-from glob import glob
+from glob import glob, has_magic
+from fnmatch import fnmatch
 import attr
 
 @attr.s
@@ -23,7 +24,21 @@ class FileHandler(object):
 
     def get_files(self, rex="*"):
         fp = self.get_path(rex)
-        return [os.path.basename(x) for x in glob(fp) if Path(x).is_file()]
+        dirname, pattern = os.path.split(fp)
+        if has_magic(dirname):
+            return [os.path.basename(x) for x in glob(fp) if Path(x).is_file()]
+
+        # Match names from a single scandir, DirEntry.is_file() avoids a stat per file
+        show_hidden = pattern.startswith(".")
+        try:
+            with os.scandir(dirname or ".") as entries:
+                return [e.name for e in entries
+                        if fnmatch(e.name, pattern) and
+                        (show_hidden or not e.name.startswith(".")) and
+                        e.is_file()]
+        except OSError:
+            # Like glob, treat missing, unreadable, or non-dir paths as empty
+            return []
 
     def write_file(self, fn: str, fdata):
         """Write binary file data"""
@@ -31,8 +46,8 @@ class FileHandler(object):
         logger = logging.getLogger(self.name)
         logger.debug("Writing {}".format(fp))
 
-        if not os.path.exists( os.path.dirname(fp) ):
-            os.makedirs(os.path.dirname(fp))
+        # Pooled writers may race to create the same subdir
+        os.makedirs(os.path.dirname(fp), exist_ok=True)
 
         with open(fp, "wb" ) as f:
             f.write(fdata)
@@ -35,8 +35,8 @@ class ImageFileHandler(FileHandler):
             # Convert to 8-bit
             data = self.squash_to_8bit(data)
 
-        if not os.path.exists( os.path.dirname(fp) ):
-            os.makedirs(os.path.dirname(fp))
+        # Pooled writers may race to create the same subdir
+        os.makedirs(os.path.dirname(fp), exist_ok=True)
 
         try:
             im = fromarray(data)
@@ -11,8 +11,8 @@ class TextFileHandler(FileHandler):
         fp = self.get_path(fn)
         # logger = logging.getLogger(self.name)
 
-        if not os.path.exists( os.path.dirname(fp) ):
-            os.makedirs(os.path.dirname(fp))
+        # Pooled writers may race to create the same subdir
+        os.makedirs(os.path.dirname(fp), exist_ok=True)
 
         with open(fp, 'w') as f:
             f.write(data)
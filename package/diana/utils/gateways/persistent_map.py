@@ -1,8 +1,8 @@
 import pickle, logging, csv, hashlib, os, glob
 from multiprocessing import Queue
+from queue import Empty
 import attr
 from abc import ABC
-import time
 
 
 def md5_digest(value):
@@ -44,6 +44,41 @@ class PersistentMap(ABC):
         data[key] = item
         self.write_data(data, key)
 
+    def put_many(self, items, early_exit=True):
+        """Put (key, item) pairs with one read and one write per backing file"""
+        logger = logging.getLogger("PMap")
+        logger.debug("Adding {} items to pmap".format(len(items)))
+
+        groups = {}
+        for key, item in items:
+            if self.keyhash_func:
+                key = self.keyhash_func(key)
+            if early_exit and (key in self.observed_keys):
+                continue
+            group = groups.setdefault(self.backend_key(key), {})
+            if early_exit and (key in group):
+                continue
+            group[key] = item
+
+        for group in groups.values():
+            # Any key in the group finds the right backing file
+            _key = next(iter(group))
+            data = self.read_data(_key)
+            if early_exit:
+                for k in data.keys():
+                    self.observed_keys.add(k)
+            changed = False
+            for key, item in group.items():
+                if early_exit and (key in data.keys()):
+                    continue
+                data[key] = item
+                changed = True
+            if changed:
+                self.write_data(data, _key)
+
+    def backend_key(self, key):
+        return None
+
     def get(self, key):
         logger = logging.getLogger("PMap")
         logger.debug("Retrieving from pmap")
@@ -58,16 +93,26 @@ class PersistentMap(ABC):
     def write_data(self, data, key):
         raise NotImplemented
 
-    def run(self, queue, early_exit=True):
+    def run(self, queue, early_exit=True, chunksize=4096):
+        """Put queued (key, item) pairs until a None sentinel is received"""
         logger = logging.getLogger("PMap")
         while True:
-            # logger.debug("Checking queue: {}".format(
-            #     "Empty" if queue.empty() else "Pending"))
-            if not queue.empty():
-                key, item = queue.get(False)
-                logger.debug("Found ({}, {})".format(key, item))
-                self.put(key, item, early_exit=early_exit)
-            time.sleep(0.01)
+            # Block for one task, then drain whatever else is ready
+            tasks = [queue.get()]
+            try:
+                while len(tasks) < chunksize and tasks[-1] is not None:
+                    tasks.append(queue.get_nowait())
+            except Empty:
+                pass
+
+            done = tasks[-1] is None
+            if done:
+                tasks.pop()
+            if tasks:
+                logger.debug("Found {} items".format(len(tasks)))
+                self.put_many(tasks, early_exit=early_exit)
+            if done:
+                break
 
 
 @attr.s
@@ -144,8 +189,11 @@ class ArrayPMapMixin(PersistentMap):
     def mk_backend(self) -> PersistentMap:
         raise NotImplementedError
 
+    def backend_key(self, key):
+        return key[0:self.prefix_len]
+
     def backend_for(self, key):
-        be_key = key[0:self.prefix_len]
+        be_key = self.backend_key(key)
         be = self.backends.get(be_key)
         if not be:
             if self.fn:
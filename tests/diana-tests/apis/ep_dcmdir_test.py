@@ -1,4 +1,4 @@
-import logging, json
+import logging, json, os
 from pprint import pformat
 from crud.abc import Serializable
 from diana.apis import DcmDir
@@ -39,6 +39,30 @@ def test_exists():
     assert( d.tags == e.tags )
 
 
+def test_header_cache():
+
+    resources_dir = find_resource("resources/dcm")
+    D = DcmDir(path=resources_dir)
+
+    d = D.get("IM2263", header_only=True)
+    e = D.get("IM2263", header_only=True)
+
+    assert( d.tags == e.tags )
+    assert( d.tags is not e.tags )
+    assert( d.meta["FileName"] == "IM2263" )
+    assert( d.tags["SOPInstanceUID"] == D.get("IM2263").tags["SOPInstanceUID"] )
+
+
+def test_inventory():
+
+    resources_dir = find_resource("resources/dcm")
+    D = DcmDir(path=resources_dir)
+
+    inventory = D.inventory()
+    assert( inventory == {"IM2263"} )
+    assert( D.inventory_key(D.get("IM2263")) in inventory )
+
+
 def test_subdirs():
 
     D = DcmDir(recurse_style="ORTHANC")
@@ -61,6 +85,35 @@ def test_subdirs():
     assert( len(subdirs) >= 8 )
 
 
+def test_subdirs_skip_hidden(tmp_path):
+
+    (tmp_path / "ab" / "cd").mkdir(parents=True)
+    (tmp_path / ".scratch" / "ef").mkdir(parents=True)
+
+    subdirs = list( DcmDir(path=tmp_path).subdirs() )
+
+    assert( len(subdirs) == 3 )
+    assert( not any(".scratch" in d for d in subdirs) )
+
+
+def test_files_unlistable(tmp_path):
+
+    fp = tmp_path / "IM0001"
+    fp.write_bytes(b"")
+    assert( DcmDir(path=str(fp)).files() == [] )
+    assert( DcmDir(path=str(tmp_path / "missing")).files() == [] )
+
+    locked = tmp_path / "locked"
+    locked.mkdir()
+    (locked / "IM0002.dcm").write_bytes(b"")
+    locked.chmod(0)
+    try:
+        if not os.access(str(locked), os.R_OK):
+            assert( DcmDir(path=str(locked)).files() == [] )
+    finally:
+        locked.chmod(0o755)
+
+
 def test_zip_reader():
 
     p = find_resource("resources")
@@ -30,6 +30,7 @@ def test_conversion(tmp_path):
     fn = "6ee6f414e4c779c8bb1f90baf45c000c-0004-0002.png"
     fp = Path( tmp_path / fn )
     assert( fp.is_file() )
+    assert( F.inventory_key(d) in F.inventory() )
     os.remove(fp)
 
 
@@ -0,0 +1,161 @@
+import threading, multiprocessing
+import attr
+import pytest
+from crud.abc import Serializable
+from diana.daemons import collector2
+from diana.daemons.collector2 import Collector, HandlerStatus
+from diana.dixel import Dixel, RadiologyReport
+from diana.apis import DcmDir
+
+
+@attr.s
+class MockProxy(object):
+    """Holds "retrieved" studies in memory"""
+
+    stored = attr.ib(factory=dict)
+
+    def exists(self, item):
+        return item.acc_num in self.stored
+
+    def anonymize(self, item, remove=True):
+        return item
+
+    def get(self, item, view=None):
+        item.file = self.stored[item.acc_num]
+        return item
+
+    def delete(self, item):
+        self.stored.pop(item.acc_num, None)
+
+
+@attr.s(order=False, hash=None)
+class MockPACS(Serializable):
+    """Finds and retrieves a fixed set of accession numbers"""
+
+    studies = attr.ib(factory=list)
+    unretrievable = attr.ib(factory=list)
+    broken = attr.ib(default=False)
+    proxy = attr.ib(init=False, factory=MockProxy, repr=False)
+
+    def find(self, query, retrieve=False):
+        if self.broken:
+            raise ValueError("PACS unavailable")
+        acc_num = query["AccessionNumber"]
+        if acc_num not in self.studies:
+            return []
+        if retrieve and acc_num not in self.unretrievable:
+            self.proxy.stored[acc_num] = acc_num.encode("UTF-8")
+        return [{"AccessionNumber": acc_num, "PatientID": "p{}".format(acc_num)}]
+
+
+def mk_worklist(acc_nums):
+    worklist = []
+    for acc_num in acc_nums:
+        d = Dixel(tags={"AccessionNumber": acc_num,
+                        "Modality": "CT",
+                        "PatientSex": "F"},
+                  meta={"BodyParts": "CHEST",
+                        "CPTCodes": "71250",
+                        "PatientAge": 60,
+                        "PatientStatus": "O"})
+        d.report = RadiologyReport("RADCAT3")
+        worklist.append(d)
+    return worklist
+
+
+def test_dead_key_handler(tmp_path):
+
+    # No meta dir, so the key handler fails on its first write
+    source = MockPACS(studies=["10000001", "10000002"])
+    worklist = mk_worklist(["1000000{}".format(i) for i in range(20)])
+
+    threads = set(threading.enumerate())
+    with pytest.raises(RuntimeError):
+        Collector(pool_size=2).run(worklist, source, tmp_path, anonymize=False)
+
+    # The progress log stops even though the run failed
+    leftover = set(threading.enumerate()) - threads
+    for t in leftover:
+        t.join(timeout=10)
+    assert( not any(t.is_alive() for t in leftover) )
+
+
+def test_failed_run_cleanup(tmp_path):
+
+    (tmp_path / "meta").mkdir()
+    source = MockPACS(studies=["10000001"], broken=True)
+
+    with pytest.raises(ValueError):
+        Collector(pool_size=2).run(mk_worklist(["10000001", "10000002"]),
+                                   source, tmp_path, anonymize=False)
+
+    # No key handler or manager process outlives the run
+    assert( not multiprocessing.active_children() )
+
+
+def counts():
+    return collector2.handled.value, collector2.skipped.value, collector2.failed.value
+
+
+def test_handle_item(tmp_path):
+
+    source = MockPACS(studies=["10000001", "10000003"], unretrievable=["10000003"])
+    dest = DcmDir(path=str(tmp_path), subpath_width=2, subpath_depth=2)
+    existing = dest.inventory()
+
+    def handle(acc_num):
+        item = mk_worklist([acc_num])[0]
+        return Collector.handle_item(item,
+                                     source=source,
+                                     data_dest=dest,
+                                     anonymize=False,
+                                     existing=existing)
+
+    assert( handle("10000001") == HandlerStatus.HANDLED )
+    assert( dest.exists("10000001") )
+    # Collected items join the inventory
+    assert( handle("10000001") == HandlerStatus.SKIPPED )
+    # Not findable
+    assert( handle("10000002") == HandlerStatus.FAILED )
+    # Found but not retrieved
+    assert( handle("10000003") == HandlerStatus.FAILED )
+
+
+def test_handle_item_explicit_args(tmp_path, monkeypatch):
+
+    # A worker's bound source and inventory don't leak into direct calls
+    dest = DcmDir(path=str(tmp_path), subpath_width=2, subpath_depth=2)
+    monkeypatch.setattr(collector2, "worker_handler", None)
+    collector2.init_worker(MockPACS().asdict(),
+                           existing={"10000001"},
+                           handler_kwargs={"data_dest": dest, "anonymize": False})
+
+    item = mk_worklist(["10000001"])[0]
+    result = Collector.handle_item(item,
+                                   source=MockPACS(studies=["10000001"]),
+                                   data_dest=dest,
+                                   anonymize=False)
+    assert( result == HandlerStatus.HANDLED )
+
+    # While the worker's own handler uses them
+    item = mk_worklist(["10000001"])[0]
+    assert( collector2.handle_worker_item(item) == HandlerStatus.SKIPPED )
+
+
+@pytest.mark.parametrize("pool_size", [0, 2])
+def test_collector(tmp_path, monkeypatch, pool_size):
+
+    (tmp_path / "meta").mkdir()
+    source = MockPACS(studies=["10000001", "10000002"])
+    acc_nums = ["10000001", "10000002", "10000003"]
+
+    Collector(pool_size=pool_size).run(mk_worklist(acc_nums), source, tmp_path, anonymize=False)
+    assert( counts() == (2, 0, 1) )
+
+    # A second run skips collected items from its startup inventory alone
+    def exists(self, item):
+        raise AssertionError("Unexpected exists() check")
+    monkeypatch.setattr(DcmDir, "exists", exists)
+
+    Collector(pool_size=pool_size).run(mk_worklist(acc_nums), source, tmp_path, anonymize=False)
+    assert( counts() == (0, 2, 1) )
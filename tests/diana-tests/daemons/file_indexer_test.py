@@ -1,11 +1,15 @@
-import logging
+import logging, shutil, threading
 from pprint import pprint
 
+from interruptingcow import timeout
 from diana.daemons import FileIndexer
+from diana.daemons import file_indexer
 from diana.apis import Orthanc, Redis
 
 import pytest
 
+from utils import find_resource
+
 # path = "/Users/derek/data/DICOM/Christianson"
 # recursion_style = "ORTHANC"
 
@@ -13,6 +17,83 @@ path = "/Users/derek/data/Protect3D/Protect3"
 recursion_style = "UNSTRUCTURED"
 
 
+def test_prefix_for_path():
+
+    prefix = FileIndexer.prefix_for_path("/data/dicom")
+    assert( len(prefix) == 5 and prefix.endswith("-") )
+    assert( prefix == FileIndexer.prefix_for_path("/data/dicom") )
+    assert( prefix != FileIndexer.prefix_for_path("/data/other") )
+
+
+@pytest.fixture
+def fake_redis():
+    """Registry served over TCP, so pool workers can connect to it too"""
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.TcpFakeServer(("127.0.0.1", 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    yield Redis(host=host, port=port)
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def dcm_tree(tmp_path):
+    """5 DICOM files over 2 levels, a non-DICOM file, and a hidden dir"""
+    dcm_file = find_resource("resources/dcm/IM2263")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / ".scratch").mkdir()
+    for i in range(3):
+        shutil.copy(dcm_file, str(tmp_path / "IM{}".format(i)))
+    for i in range(2):
+        shutil.copy(dcm_file, str(tmp_path / "sub" / "IM{}".format(i)))
+    shutil.copy(dcm_file, str(tmp_path / ".scratch" / "IM0"))
+    (tmp_path / "notes.txt").write_text("not dicom")
+    return str(tmp_path)
+
+
+@pytest.mark.parametrize("pool_size, n_threads",
+                         ((0, 0), (0, 3), (2, 0), (2, 2)),
+                         ids=("serial", "threads", "pool", "pool_threads"))
+def test_index_modes(fake_redis, dcm_tree, pool_size, n_threads):
+
+    dcmfdx = FileIndexer(pool_size=pool_size, n_threads=n_threads, batch_size=2)
+    with timeout(30, exception=RuntimeError):
+        dcmfdx.index_path(dcm_tree, registry=fake_redis, rex="*")
+
+    assert( file_indexer.checked.value == 6 )
+    assert( file_indexer.registered.value == 5 )
+
+    # Every registration reached the registry
+    prefix = FileIndexer.prefix_for_path(dcm_tree)
+    items = [fn for collection in fake_redis.collections(prefix=prefix)
+             for fn in fake_redis.collected_items(collection, prefix=prefix)]
+    assert( len(items) == 5 )
+    assert( not any(".scratch" in fn for fn in items) )
+
+
+def test_index_reader_failure(fake_redis, dcm_tree):
+
+    class DeadPipeline(object):
+        def sadd(self, *args):
+            pass
+        def execute(self):
+            raise ConnectionError("Registry went away")
+
+    fake_redis.pipeline = DeadPipeline
+
+    # More files than the work queue holds, so a stuck walker would block
+    dcm_file = find_resource("resources/dcm/IM2263")
+    for i in range(40):
+        shutil.copy(dcm_file, "{}/sub/IM1{:02}".format(dcm_tree, i))
+
+    # Dead readers must fail the run rather than leave the walker blocked
+    dcmfdx = FileIndexer(n_threads=2, batch_size=1)
+    with timeout(30, exception=RuntimeError):
+        with pytest.raises(ConnectionError):
+            dcmfdx.index_path(dcm_tree, registry=fake_redis, rex="*")
+
+
 @pytest.mark.skip(reason="Needs large dataset for indexing")
 def test_index(setup_redis):
 
@@ -32,10 +32,38 @@ def test_reader():
 
     DcmFileHandler().get(dcm_file)
 
+    ds = DcmFileHandler().get(dcm_file, header_only=True)
+    assert( ds.SOPInstanceUID )
+    assert( "StudyDescription" not in ds )
+
     with pytest.raises(DicomFormatError):
         DcmFileHandler().get(json_file)
 
 
+def test_pixel_decoder(monkeypatch):
+
+    pytest.importorskip("pydicom.pixels")
+    import pydicom
+    from pydicom.data import get_testdata_file
+    from pydicom.pixels.decoders import RLELosslessDecoder
+    from diana.utils.gateways.file_handlers import dcm_file
+
+    fn = get_testdata_file("SC_rgb_rle.dcm")
+    expected = pydicom.dcmread(fn).pixel_array
+
+    ds = DcmFileHandler().get(fn, get_pixels=True)
+    if "pylibjpeg" in RLELosslessDecoder.available_plugins:
+        assert( dcm_file.preferred_decoding_plugin(ds) == "pylibjpeg" )
+    else:
+        assert( dcm_file.preferred_decoding_plugin(ds) == "" )
+    assert( (ds.pixel_array == expected).all() )
+
+    # RLE has no gdcm plugin, so pydicom's own choice decodes instead
+    monkeypatch.setattr(dcm_file, "preferred_decoding_plugin", lambda ds: "gdcm")
+    ds = DcmFileHandler().get(fn, get_pixels=True)
+    assert( (ds.pixel_array == expected).all() )
+
+
 if __name__ == "__main__":
 
     logging.basicConfig(level=logging.DEBUG)
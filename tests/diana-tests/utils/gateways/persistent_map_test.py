@@ -0,0 +1,74 @@
+from multiprocessing import Process, Queue
+from diana.utils.gateways import PicklePMap, PickleArrayPMap, CSVArrayPMap, CSVPMap
+
+import pytest
+
+
+@pytest.mark.parametrize("cache_class",
+                         (PicklePMap, CSVPMap, PickleArrayPMap, CSVArrayPMap),
+                         ids=("pickle", "csv", "pickle_array", "csv_array"))
+def test_put_many(tmp_path, cache_class):
+
+    cache = cache_class(fn="{}/cache-{{}}".format(tmp_path))
+
+    cache.put_many([("key1", {"value": 100}),
+                    ("key2", {"value": 200}),
+                    ("key1", {"value": 101})])
+    assert( int( cache.get("key1").get("value") ) == 100)
+    assert( int( cache.get("key2").get("value") ) == 200)
+
+    cache.put_many([("key1", {"value": 101})], early_exit=False)
+    assert( int( cache.get("key1").get("value") ) == 101)
+    assert( not cache.get("key3") )
+
+    cache.clear()
+
+
+@pytest.mark.parametrize("cache_class",
+                         (PicklePMap, CSVPMap, PickleArrayPMap, CSVArrayPMap),
+                         ids=("pickle", "csv", "pickle_array", "csv_array"))
+def test_put_many_unchanged(tmp_path, monkeypatch, cache_class):
+
+    cache = cache_class(fn="{}/cache-{{}}".format(tmp_path))
+    cache.put_many([("key1", {"value": 100}), ("key2", {"value": 200})])
+
+    # Keys already in a backing file don't rewrite it
+    writes = []
+    write_data = cache.write_data
+
+    def record_write(data, key):
+        writes.append(key)
+        write_data(data, key)
+
+    monkeypatch.setattr(cache, "write_data", record_write)
+    cache.observed_keys.clear()
+    cache.put_many([("key1", {"value": 101}), ("key2", {"value": 201})])
+    assert( not writes )
+    assert( int( cache.get("key1").get("value") ) == 100)
+
+    cache.clear()
+
+
+@pytest.mark.parametrize("cache_class",
+                         (PicklePMap, CSVPMap, PickleArrayPMap, CSVArrayPMap),
+                         ids=("pickle", "csv", "pickle_array", "csv_array"))
+def test_run_until_sentinel(tmp_path, cache_class):
+
+    cache = cache_class(fn="{}/cache-{{}}".format(tmp_path))
+
+    q = Queue()
+    p = Process(target=cache.run, args=[q], kwargs={"early_exit": False})
+    p.start()
+    q.put( ("key1", {"value": 100}) )
+    q.put( ("key1", {"value": 101}) )
+    q.put( ("key2", {"value": 200}) )
+    q.put( None )
+    p.join(timeout=10)
+
+    # Exits on its own once the queue is drained
+    assert( not p.is_alive() and p.exitcode == 0 )
+    assert( int( cache.get("key1").get("value") ) == 101)
+    assert( int( cache.get("key2").get("value") ) == 200)
+    assert( not cache.get("key3") )
+
+    cache.clear()